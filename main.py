@@ -1,66 +1,311 @@
 import os
-import traceback
-import time
-import random
-import anthropic
-from fastapi import FastAPI, HTTPException, Request, Header, Depends
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+import atexit
+import logging
+import logging.handlers
+import queue
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
-from anthropic import Anthropic, HUMAN_PROMPT, AI_PROMPT, APIStatusError
 
-print("Starting Claude Confluence Bot API...")
+# Load .env file
+load_dotenv()
+
+# Logging: records are queued on the request path and written to stdout
+# by a background listener thread
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+log_queue = queue.SimpleQueue()
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+log_listener = logging.handlers.QueueListener(log_queue, log_handler)
+log_listener.start()
+atexit.register(lambda: log_listener.stop())
+
+
+def _restart_log_listener():
+    # Threads do not survive fork, so each preloaded worker needs its own listener
+    global log_listener
+    log_listener = logging.handlers.QueueListener(log_queue, log_handler)
+    log_listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_log_listener)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(LOG_LEVEL)
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
+logger.propagate = False
+
+logger.info("Starting Claude Confluence Bot API...")
+logger.info("Environment variables loaded.")
 
 # Disable tokenizer parallelism to avoid warnings
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-print("Loading environment variables...")
-
-# Load .env file
-load_dotenv()
+# Ask NVML whether a GPU exists instead of initializing CUDA, which would break the forked workers
+os.environ.setdefault("PYTORCH_NVML_BASED_CUDA_CHECK", "1")
+# gunicorn workers (1 under plain uvicorn); each one gets its share of the cores
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY") or 1)
+# OpenMP/MKL read their pool size once, so set it before torch gets imported
+EMBED_NUM_THREADS = int(os.getenv("EMBED_NUM_THREADS") or max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY))
+os.environ.setdefault("OMP_NUM_THREADS", str(EMBED_NUM_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(EMBED_NUM_THREADS))
+# Numba's OpenMP/TBB layers break in forked workers; the semantic cache scan is small enough for workqueue
+os.environ.setdefault("NUMBA_THREADING_LAYER", "workqueue")
 
-print("Environment variables loaded.")
+import asyncio
+import functools
+from collections import OrderedDict
+import random
+import httpx
+import numpy as np
+import orjson
+from aiolimiter import AsyncLimiter
+import torch
+from fastapi import FastAPI, HTTPException, Request, Header, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from sentence_transformers import SentenceTransformer
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http.models import SearchParams, QuantizationSearchParams, PayloadSelectorInclude
+from anthropic import AsyncAnthropic, APIError, APIStatusError
+from onnx_encoder import OnnxEncoder
+from semantic_cache import SemanticCache
 
 # Configuration
 QDRANT_HOST = os.getenv("QDRANT_HOST")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", 6333))
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", 6334))
+QDRANT_POOL_SIZE = int(os.getenv("QDRANT_POOL_SIZE", 100))
+QDRANT_HNSW_EF = int(os.getenv("QDRANT_HNSW_EF", 64))
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 QDRANT_USE_SSL = os.getenv("QDRANT_USE_SSL", "false").lower() == "true"
 COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "confluence_knowledge")
 CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY")
 CLAUDE_MODEL = os.getenv("CLAUDE_MODEL", "claude-3-sonnet-20240620")
+CLAUDE_RPM = int(os.getenv("CLAUDE_RPM", 50))
+CLAUDE_MAX_RETRIES = int(os.getenv("CLAUDE_MAX_RETRIES", 3))
 API_KEY = os.getenv("API_KEY")
+ENCODER_ONNX_PATH = os.getenv("ENCODER_ONNX_PATH", "minilm_int8.onnx")
+EMBED_DEVICE = os.getenv("EMBED_DEVICE") or ("cuda" if torch.cuda.is_available() else "cpu")
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", 32))
+EMBED_ENCODE_BATCH = int(os.getenv("EMBED_ENCODE_BATCH", 16))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", 10))
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", 4096))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.97))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 10000))
+SEMANTIC_CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR", ".semantic_cache")
+SEMANTIC_CACHE_HNSW_MIN = int(os.getenv("SEMANTIC_CACHE_HNSW_MIN", 50000))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 86400)) or None
 
-print("Configuration loaded.")  
+logger.info("Configuration loaded.")
 
 # Initialization
+# Interop threads can only be set before torch starts any parallel work
+torch.set_num_threads(EMBED_NUM_THREADS)
+torch.set_num_interop_threads(1)
+
 app = FastAPI(title="Claude Confluence Bot API (with Auth)")
-embedder = SentenceTransformer("paraphrase-MiniLM-L6-v2")
-anthropic = Anthropic(api_key=CLAUDE_API_KEY)
+# The encoder is built at import time, so `gunicorn --preload` reads the model
+# once in the master. Only the CPU SentenceTransformer keeps its weights shared
+# copy-on-write after the fork: the ONNX encoder opens a session per worker, and
+# the CUDA model is moved to the GPU per worker at startup (CUDA cannot be used
+# across a fork).
+if EMBED_DEVICE.startswith("cuda"):
+    # fp16 on the GPU beats the INT8 CPU graph; the batcher amortizes kernel launches
+    logger.info("Loading SentenceTransformer for %s (fp16).", EMBED_DEVICE)
+    torch.set_float32_matmul_precision("high")
+    embedder = SentenceTransformer("paraphrase-MiniLM-L6-v2", device="cpu").half()
+elif os.path.exists(ENCODER_ONNX_PATH):
+    # Quantized model produced by scripts/export_encoder.py
+    logger.info("Loading ONNX encoder from %s.", ENCODER_ONNX_PATH)
+    embedder = OnnxEncoder(ENCODER_ONNX_PATH, num_threads=EMBED_NUM_THREADS)
+else:
+    logger.info("No ONNX encoder found, falling back to SentenceTransformer.")
+    embedder = SentenceTransformer("paraphrase-MiniLM-L6-v2", device=EMBED_DEVICE)
+# Shared keep-alive HTTP/2 pool so Claude calls skip the TCP/TLS handshake
+anthropic_http = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=100, max_connections=200),
+)
+# SDK retries off: the limiter plus our full-jitter loop are the only retry path
+anthropic = AsyncAnthropic(api_key=CLAUDE_API_KEY, http_client=anthropic_http, max_retries=0)
+# Token bucket shared by all requests of this worker; every worker has its own,
+# so each gets an equal share of the Anthropic rate limit
+claude_limiter = AsyncLimiter(max_rate=max(1, CLAUDE_RPM / WEB_CONCURRENCY), time_period=60)
 
-print("FastAPI app and SentenceTransformer initialized.")
+logger.info("FastAPI app and encoder initialized.")
 
 # Initialize Qdrant client based on configuration
 if QDRANT_API_KEY:
     # Production setup with API key
-    print("QDRANT_API_KEY found, connecting with API key.")
-    qdrant = QdrantClient(
+    logger.info("QDRANT_API_KEY found, connecting with API key.")
+    qdrant = AsyncQdrantClient(
         host=QDRANT_HOST,
         port=QDRANT_PORT,
+        grpc_port=QDRANT_GRPC_PORT,
+        prefer_grpc=True,
+        pool_size=QDRANT_POOL_SIZE,
+        timeout=60,
         api_key=QDRANT_API_KEY,
         https=QDRANT_USE_SSL,
     )
 else:
     # Local setup without API key
-    print("QDRANT_API_KEY not found, connecting without API key.")
-    qdrant = QdrantClient(
+    logger.info("QDRANT_API_KEY not found, connecting without API key.")
+    qdrant = AsyncQdrantClient(
         host=QDRANT_HOST, 
         port=QDRANT_PORT,
+        grpc_port=QDRANT_GRPC_PORT,
+        prefer_grpc=True,
+        pool_size=QDRANT_POOL_SIZE,
+        timeout=60,
         https=QDRANT_USE_SSL
     )
 
+# Embedding micro-batching
+class EmbeddingBatcher:
+    """Coalesces concurrent embed() calls into a single encoder forward pass.
+
+    Requests arriving within ``max_wait_ms`` of each other (up to ``max_batch``)
+    are encoded together in a worker thread, so the event loop stays free.
+    Embeddings of recently seen questions are served from an exact-match LRU
+    without touching the encoder.
+
+    A flushed batch is ordered by token length and encoded in mini-batches of
+    ``encode_batch``, so short questions are not padded to the longest one.
+    """
+
+    def __init__(self, model, max_batch: int = 32, max_wait_ms: float = 10, cache_size: int = 4096, encode_batch: int = 16):
+        self.model = model
+        self.max_batch = max_batch
+        self.encode_batch = encode_batch
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def embed(self, text: str) -> np.ndarray:
+        # The encoder is uncased and ignores surrounding whitespace, so this key is exact
+        key = text.strip().lower()
+        vector = self._cache.get(key)
+        if vector is not None:
+            self._cache.move_to_end(key)
+            return vector
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        vector = await future
+        if self.cache_size > 0:
+            vector.setflags(write=False)  # shared between requests
+            self._cache[key] = vector
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return vector
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    def _encode_sorted(self, texts):
+        lengths = self._token_lengths(texts)
+        order = np.argsort(lengths, kind="stable")
+        vectors = self.model.encode(
+            [texts[i] for i in order],
+            batch_size=self.encode_batch,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+        # Undo the length sort so vectors line up with the waiting futures again
+        unsorted = np.empty_like(vectors)
+        unsorted[order] = vectors
+        return unsorted
+
+    def _token_lengths(self, texts):
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            return [len(text) for text in texts]
+        return tokenizer(texts, add_special_tokens=False, return_length=True)["length"]
+
+    async def _flush(self, batch):
+        texts = [text for text, _ in batch]
+        encode = functools.partial(self._encode_sorted, texts)
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(None, encode)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+batcher = EmbeddingBatcher(
+    embedder,
+    max_batch=EMBED_MAX_BATCH,
+    max_wait_ms=EMBED_MAX_WAIT_MS,
+    cache_size=EMBED_CACHE_SIZE,
+    encode_batch=EMBED_ENCODE_BATCH,
+)
+answer_cache = SemanticCache(
+    dim=embedder.get_sentence_embedding_dimension(),
+    max_entries=SEMANTIC_CACHE_SIZE,
+    path=SEMANTIC_CACHE_DIR or None,
+    hnsw_min_entries=SEMANTIC_CACHE_HNSW_MIN,
+    ttl=SEMANTIC_CACHE_TTL,
+)
+logger.info("Semantic cache loaded with %d entries.", len(answer_cache))
+
+@app.on_event("startup")
+async def warm_up_encoder():
+    if EMBED_DEVICE.startswith("cuda"):
+        # First CUDA use happens here, in the worker, never in the preloading master
+        embedder.to(EMBED_DEVICE)
+    # Run one batch so kernel selection and allocator growth happen before the first real request
+    embedder.encode(["warmup"] * 8, batch_size=8)
+    logger.info("Encoder warmed up with %d threads.", EMBED_NUM_THREADS)
+
+@app.on_event("startup")
+async def start_batcher():
+    batcher.start()
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    await batcher.stop()
+    await anthropic_http.aclose()
+    await qdrant.close()
+
+# HNSW beam width for queries; twice the quantized candidates are rescored with full vectors
+SEARCH_PARAMS = SearchParams(
+    hnsw_ef=QDRANT_HNSW_EF,
+    quantization=QuantizationSearchParams(rescore=True, oversampling=2.0),
+)
+
+# Only the payload fields the prompt and the response actually use
+CONTEXT_PAYLOAD = PayloadSelectorInclude(include=["title", "url", "text"])
+
 # API-Key Auth Dependency
 def verify_api_key(x_api_key: str = Header(...)):
     if x_api_key != API_KEY:
@@ -76,39 +321,113 @@ class AskResponse(BaseModel):
     sources: list[dict]
 
 # Helper functions
-def search_qdrant(query: str, top_k: int):
-    vector = embedder.encode(query).tolist()
-    hits = qdrant.search(
+async def search_qdrant(vector: np.ndarray, top_k: int):
+    # query_points takes the float32 array as-is, no per-element list conversion
+    result = await qdrant.query_points(
         collection_name=COLLECTION_NAME,
-        query_vector=vector,
+        query=np.asarray(vector, dtype=np.float32),
+        search_params=SEARCH_PARAMS,
         limit=top_k,
-        with_payload=True
+        with_payload=CONTEXT_PAYLOAD
     )
-    return [hit.payload for hit in hits]
+    return [hit.payload for hit in result.points]
+
+ANSWER_MODEL = "claude-3-haiku-20240307"
+ANSWER_MAX_TOKENS = 1000
+NO_CONTEXT_ANSWER = "I couldn't find any relevant information in the knowledge base to answer your question."
+
+# Static instructions are sent as a cacheable system block; only the user turn varies per request
+SYSTEM_PROMPT = (
+    "Based on the following context from our knowledge base, please answer the user's question.\n"
+    "Answer in the same language as the user's question.\n"
+    "Cite the sources you used in your answer using markdown links like [Source Title](URL)."
+)
+SYSTEM_BLOCKS = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+USER_TEMPLATE = "Context:\n{context}\n\nQuestion: {question}"
+
+def format_context(res: dict) -> str:
+    return f"Source: {res['url']}\nContent: {res['text']}"
 
-def call_claude_throttled(prompt, delay=2, retries=3):
+def build_prompt(question: str, context_results: list[dict]) -> str:
+    context = "\n\n".join(format_context(res) for res in context_results)
+    logger.debug("Built context for prompt with %d sources", len(context_results))
+
+    return USER_TEMPLATE.format(context=context, question=question)
+
+def format_sources(context_results: list[dict]) -> list[dict]:
+    return [{"title": res["title"], "url": res["url"]} for res in context_results]
+
+async def call_claude_throttled(prompt, retries=CLAUDE_MAX_RETRIES):
     for attempt in range(retries):
         try:
-            time.sleep(delay)  # delay between attempts
-            response = anthropic.messages.create(
-                model="claude-3-haiku-20240307",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=1000
-            )
+            async with claude_limiter:
+                response = await anthropic.messages.create(
+                    model=ANSWER_MODEL,
+                    system=SYSTEM_BLOCKS,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=ANSWER_MAX_TOKENS
+                )
             return response.content[0].text if hasattr(response, "content") else response
         except APIStatusError as e:
-            if getattr(e, "status_code", None) == 529:
-                wait = delay + attempt + random.uniform(0.1, 0.5)
-                print(f"Overloaded. Waiting {wait:.2f}s before retry...")
-                time.sleep(wait)
+            if getattr(e, "status_code", None) == 529 and attempt < retries - 1:
+                # Full jitter keeps retrying workers from hitting the API in lockstep
+                wait = random.uniform(0, 2 ** attempt)
+                logger.warning("Overloaded. Waiting %.2fs before retry...", wait)
+                await asyncio.sleep(wait)
             else:
                 raise
-    raise Exception("Failed after retries due to overload.")
+
+# Server-sent events for /ask/stream
+def sse_event(event: str, data: dict) -> bytes:
+    # Encoded once per streamed token, so use orjson's direct-to-UTF-8 bytes
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+async def replay_answer(response: AskResponse):
+    yield sse_event("answer", {"text": response.answer})
+    yield sse_event("sources", {"sources": response.sources})
+
+async def stream_claude(vector: np.ndarray, top_k: int, prompt: str, sources: list[dict], retries=CLAUDE_MAX_RETRIES):
+    parts = []
+    try:
+        for attempt in range(retries):
+            try:
+                await claude_limiter.acquire()
+                async with anthropic.messages.stream(
+                    model=ANSWER_MODEL,
+                    system=SYSTEM_BLOCKS,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=ANSWER_MAX_TOKENS
+                ) as stream:
+                    async for text in stream.text_stream:
+                        parts.append(text)
+                        yield sse_event("answer", {"text": text})
+                break
+            except APIStatusError as e:
+                # Same full-jitter back-off as /ask, but only before any text went out
+                if e.status_code == 529 and not parts and attempt < retries - 1:
+                    wait = random.uniform(0, 2 ** attempt)
+                    logger.warning("Overloaded. Waiting %.2fs before retry...", wait)
+                    await asyncio.sleep(wait)
+                else:
+                    raise
+    except APIError as e:
+        # The 200 is already sent, so every failure (status, connection, timeout) becomes an error event
+        status_code = getattr(e, "status_code", None)
+        logger.error("%s while streaming: %s (status_code=%s)", type(e).__name__, e, status_code)
+        if status_code == 529:
+            message = "The service is temporarily overloaded. Please try again later."
+        else:
+            message = f"An unexpected API error occurred: {e}"
+        yield sse_event("error", {"status_code": status_code, "message": message})
+        return
+
+    answer_cache.insert(vector, {"answer": "".join(parts), "sources": sources}, scope=top_k)
+    yield sse_event("sources", {"sources": sources})
 
 # Exception handler
 @app.exception_handler(Exception)
 async def generic_exception_handler(request: Request, exc: Exception):
-    traceback.print_exc()
+    logger.error("Unhandled error", exc_info=exc)
     return JSONResponse(
         status_code=500,
         content={"type": "error", "error": {"type": "internal_server_error", "message": str(exc)}},
@@ -116,50 +435,48 @@ async def generic_exception_handler(request: Request, exc: Exception):
 
 # API Endpoints
 @app.post("/ask", response_model=AskResponse, dependencies=[Depends(verify_api_key)])
-def ask(request: AskRequest):
+async def ask(request: AskRequest):
     try:
-        print(f"[DEBUG] Received /ask request: question='{request.question}', top_k={request.top_k}")
-
-        # 1. Search for relevant context in Qdrant
-        context_results = search_qdrant(request.question, request.top_k)
-        print(f"[DEBUG] Qdrant search returned {len(context_results) if context_results else 0} results")
+        logger.debug("Received /ask request: question=%r, top_k=%d", request.question, request.top_k)
 
-        # Print up to 3 search results for debugging
-        for i, res in enumerate(context_results[:3]):
-            print(f"[DEBUG] Search result {i+1}: title='{res.get('title')}', url='{res.get('url')}', text='{res.get('text')[:100]}...'")
-
-        if not context_results:
-            print("[DEBUG] No relevant context found in Qdrant")
-            return AskResponse(answer="I couldn't find any relevant information in the knowledge base to answer your question.", sources=[])
+        # 1. Embed the question and answer from the semantic cache if a near-duplicate was seen
+        vector = await batcher.embed(request.question)
+        cached = answer_cache.lookup(vector, threshold=SEMANTIC_CACHE_THRESHOLD, scope=request.top_k)
+        if cached is not None:
+            logger.debug("Semantic cache hit")
+            return AskResponse(**cached)
 
-        # 2. Build the prompt for Claude
-        context = "\n\n".join([f"Source: {res['url']}\nContent: {res['text']}" for res in context_results])
-        print(f"[DEBUG] Built context for prompt with {len(context_results)} sources")
+        # 2. Search for relevant context in Qdrant
+        context_results = await search_qdrant(vector, request.top_k)
+        logger.debug("Qdrant search returned %d results", len(context_results))
 
-        user_prompt = f"""{HUMAN_PROMPT}
-        Based on the following context from our knowledge base, please answer the user's question.
-        Answer in the same language as the user's question.
-        Cite the sources you used in your answer using markdown links like [Source Title](URL).
+        # Log up to 3 search results for debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, res in enumerate(context_results[:3]):
+                logger.debug("Search result %d: title=%r, url=%r, text=%r...", i + 1, res.get('title'), res.get('url'), res.get('text', '')[:100])
 
-        Context:
-        {context}
+        if not context_results:
+            logger.debug("No relevant context found in Qdrant")
+            return AskResponse(answer=NO_CONTEXT_ANSWER, sources=[])
 
-        Question: {request.question}
-        {AI_PROMPT}
-        """
-        print("[DEBUG] User prompt for Claude constructed")
+        # 3. Build the prompt for Claude
+        user_prompt = build_prompt(request.question, context_results)
+        logger.debug("User prompt for Claude constructed")
 
-        # 3. Get the answer from Claude
-        answer = call_claude_throttled(user_prompt)
-        print("[DEBUG] Received answer from Claude")
+        # 4. Get the answer from Claude
+        answer = await call_claude_throttled(user_prompt)
+        logger.debug("Received answer from Claude")
 
-        # 4. Format and return the response
-        sources = [{"title": res["title"], "url": res["url"]} for res in context_results]
-        print(f"[DEBUG] Returning response with {len(sources)} sources")
-        return AskResponse(answer=answer, sources=sources)
+        # 5. Format, cache and return the response
+        sources = format_sources(context_results)
+        logger.debug("Returning response with %d sources", len(sources))
+        response = AskResponse(answer=answer, sources=sources)
+        # Plain dicts in the cache: the persisted entries are unpickled before this module defines AskResponse
+        answer_cache.insert(vector, response.model_dump(), scope=request.top_k)
+        return response
 
     except APIStatusError as e:
-        print(f"[ERROR] APIStatusError: {e} (status_code={e.status_code})")
+        logger.error("APIStatusError: %s (status_code=%s)", e, e.status_code)
         # Specifically handle API errors after retries
         if e.status_code == 529:
             raise HTTPException(status_code=503, detail="The service is temporarily overloaded. Please try again later.")
@@ -167,11 +484,37 @@ def ask(request: AskRequest):
             raise HTTPException(status_code=500, detail=f"An unexpected API error occurred: {e}")
 
     except Exception as e:
-        print(f"[ERROR] An unexpected error occurred: {e}")
-        traceback.print_exc()
+        logger.exception("An unexpected error occurred: %s", e)
         # The generic exception handler will catch this and return a 500 error
         raise e
 
+@app.post("/ask/stream", dependencies=[Depends(verify_api_key)])
+async def ask_stream(request: AskRequest):
+    """Same pipeline as /ask, but streams Claude's answer as server-sent events.
+
+    Emits ``answer`` events with text deltas, then a final ``sources`` event
+    (or an ``error`` event if Claude fails mid-stream).
+    """
+    logger.debug("Received /ask/stream request: question=%r, top_k=%d", request.question, request.top_k)
+
+    vector = await batcher.embed(request.question)
+    cached = answer_cache.lookup(vector, threshold=SEMANTIC_CACHE_THRESHOLD, scope=request.top_k)
+    if cached is not None:
+        logger.debug("Semantic cache hit")
+        return StreamingResponse(replay_answer(AskResponse(**cached)), media_type="text/event-stream")
+
+    context_results = await search_qdrant(vector, request.top_k)
+    logger.debug("Qdrant search returned %d results", len(context_results))
+    if not context_results:
+        no_context = AskResponse(answer=NO_CONTEXT_ANSWER, sources=[])
+        return StreamingResponse(replay_answer(no_context), media_type="text/event-stream")
+
+    user_prompt = build_prompt(request.question, context_results)
+    return StreamingResponse(
+        stream_claude(vector, request.top_k, user_prompt, format_sources(context_results)),
+        media_type="text/event-stream",
+    )
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
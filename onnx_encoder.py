@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+
+
+class OnnxEncoder:
+    """Drop-in replacement for SentenceTransformer.encode backed by ONNX Runtime.
+
+    Expects a model produced by scripts/export_encoder.py, which outputs the
+    token embeddings; mean pooling and L2 normalization are done in NumPy.
+
+    An ORT session must not cross a fork (its thread pool stays behind and the
+    child hangs on exit), so the session is closed before forking and each
+    process, e.g. a `gunicorn --preload` worker, opens its own on first use.
+    Every worker therefore holds its own copy of the weights.
+    """
+
+    def __init__(self, model_path: str, tokenizer_name: str = "sentence-transformers/paraphrase-MiniLM-L6-v2", max_seq_length: int = 128, num_threads: int | None = None):
+        self.model_path = model_path
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self.session = self._new_session()
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        self.max_seq_length = max_seq_length
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self._dim = self.session.get_outputs()[0].shape[-1]
+        os.register_at_fork(before=self._drop_session)
+
+    def _new_session(self) -> ort.InferenceSession:
+        sess_options = ort.SessionOptions()
+        sess_options.intra_op_num_threads = self.num_threads
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        return ort.InferenceSession(self.model_path, sess_options=sess_options, providers=["CPUExecutionProvider"])
+
+    def _drop_session(self):
+        self.session = None
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dim
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            batches.append(self._encode_batch(sentences[start:start + batch_size], normalize_embeddings))
+        embeddings = np.concatenate(batches) if batches else np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+    def _encode_batch(self, sentences, normalize: bool) -> np.ndarray:
+        encoded = self.tokenizer(
+            sentences,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np",
+        )
+        feed = {name: value.astype(np.int64) for name, value in encoded.items() if name in self._input_names}
+        if self.session is None:
+            self.session = self._new_session()
+        token_embeddings = self.session.run(None, feed)[0]
+
+        # Mean pooling over non-padding tokens
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if normalize:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype(np.float32)
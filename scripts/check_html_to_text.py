@@ -0,0 +1,47 @@
+"""Compares html_to_text with the BeautifulSoup get_text output it replaced.
+
+Runs on storage-format samples (macros, CDATA code blocks, tables, entities).
+Run after touching html_to_text; bump TEXT_VERSION in src/embed_to_qdrant.py
+when the output changes on purpose.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from embed_to_qdrant import html_to_text
+
+# (storage-format markup, BeautifulSoup(html, "html.parser").get_text(separator="\n"))
+SAMPLES = [
+    (
+        '<p>Intro</p><ac:structured-macro ac:name="code"><ac:plain-text-body><![CDATA[pip install foo --upgrade]]>'
+        '</ac:plain-text-body></ac:structured-macro><p>After</p>',
+        "Intro\npip install foo --upgrade\nAfter",
+    ),
+    (
+        '<ac:structured-macro ac:name="code"><ac:parameter ac:name="language">python</ac:parameter>'
+        '<ac:plain-text-body><![CDATA[if a < b and c > d:\n    print("x & y")]]></ac:plain-text-body></ac:structured-macro>',
+        'python\nif a < b and c > d:\n    print("x & y")',
+    ),
+    (
+        '<ac:structured-macro ac:name="noformat"><ac:plain-text-body><![CDATA[line1\nline2 <tag> &amp;]]>'
+        '</ac:plain-text-body></ac:structured-macro><table><tbody><tr><th>A</th><td>b &amp; c</td></tr></tbody></table>',
+        "line1\nline2 <tag> &amp;\nA\nb & c",
+    ),
+    (
+        '<h1>Titel</h1><p>Hallo <b>Welt</b> &amp; mehr</p><ac:structured-macro ac:name="info"><ac:rich-text-body>'
+        "<p>Makro</p></ac:rich-text-body></ac:structured-macro><ul><li>eins</li><li>zwei</li></ul>",
+        "Titel\nHallo \nWelt\n & mehr\nMakro\neins\nzwei",
+    ),
+    ("", ""),
+]
+
+if __name__ == "__main__":
+    failed = 0
+    for html, expected in SAMPLES:
+        text = html_to_text(html)
+        if text != expected:
+            failed += 1
+            print(f"❌ {html[:60]!r}\n   erwartet: {expected!r}\n   erhalten: {text!r}")
+    print(f"{len(SAMPLES) - failed}/{len(SAMPLES)} Beispiele identisch")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,66 @@
+"""Export the MiniLM sentence encoder to ONNX and quantize it to INT8.
+
+The resulting model is picked up by main.py (see ENCODER_ONNX_PATH) and runs
+through ONNX Runtime instead of the PyTorch eager graph.
+
+Usage:
+    python scripts/export_encoder.py [output_path]
+"""
+import os
+import sys
+import tempfile
+
+import torch
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from sentence_transformers import SentenceTransformer
+
+MODEL_NAME = "paraphrase-MiniLM-L6-v2"
+DEFAULT_OUTPUT = os.getenv("ENCODER_ONNX_PATH", "minilm_int8.onnx")
+
+
+class TokenEmbeddings(torch.nn.Module):
+    """Exposes the transformer's last hidden state; pooling happens in OnnxEncoder."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        return self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            token_type_ids=token_type_ids,
+        ).last_hidden_state
+
+
+def export(output_path: str):
+    st_model = SentenceTransformer(MODEL_NAME, device="cpu")
+    wrapper = TokenEmbeddings(st_model[0].auto_model).eval()
+    sample = st_model.tokenizer(["warmup sentence"], return_tensors="pt")
+    inputs = (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"])
+    seq_axes = {0: "batch", 1: "seq"}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fp32_path = os.path.join(tmp, "model_fp32.onnx")
+        torch.onnx.export(
+            wrapper,
+            inputs,
+            fp32_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": seq_axes,
+                "attention_mask": seq_axes,
+                "token_type_ids": seq_axes,
+                "last_hidden_state": seq_axes,
+            },
+            opset_version=17,
+            dynamo=False,
+        )
+        quantize_dynamic(fp32_path, output_path, weight_type=QuantType.QInt8)
+
+    print(f"✅ Quantized encoder written to {output_path}")
+
+
+if __name__ == "__main__":
+    export(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_OUTPUT)
@@ -0,0 +1,242 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import diskcache
+import faiss
+import numpy as np
+from numba import njit, prange
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def cosine_topk(query, bank, k):
+    """Top-k rows of ``bank`` by dot product with ``query`` (both L2-normalized)."""
+    n = bank.shape[0]
+    scores = np.empty(n, dtype=np.float32)
+    for i in prange(n):
+        acc = np.float32(0.0)
+        for j in range(bank.shape[1]):
+            acc += bank[i, j] * query[j]
+        scores[i] = acc
+    k = min(k, n)
+    if k == 1:
+        best = np.empty(1, dtype=np.int64)
+        best[0] = np.argmax(scores)
+    else:
+        best = np.argsort(-scores)[:k]
+    return best, scores[best]
+
+
+class SemanticCache:
+    """LRU cache of answers keyed by (normalized) question embeddings.
+
+    A lookup returns the cached value of the most similar stored question if
+    its cosine similarity reaches the threshold and it was stored under the
+    same ``scope`` (e.g. the request's top_k). With ``ttl`` set, entries older
+    than ``ttl`` seconds no longer hit and expire from disk. Vectors live in a fixed-size
+    float32 bank scanned by a Numba kernel; an evicted entry's row is reused
+    by the next insert. Entries are mirrored to a diskcache directory so a
+    restarted process does not start cold.
+
+    From ``hnsw_min_entries`` on, the linear scan is replaced by a Faiss HNSW
+    graph. HNSW cannot delete, so a reused row gets a new graph label and the
+    old label is skipped as stale; once stale labels make up half of the graph
+    it is rebuilt from a snapshot of the bank in a background thread, and the
+    new graph is swapped in, together with the rows written meanwhile, when it
+    is done.
+    """
+
+    HNSW_M = 32
+    HNSW_EF_CONSTRUCTION = 128
+    HNSW_EF_SEARCH = 64
+    HNSW_CANDIDATES = 8  # neighbours fetched per lookup, so a few stale hits do not cause a miss
+    HNSW_SWAP_PENDING = 64  # rows a background rebuild may still add under the lock when swapping in
+
+    def __init__(self, dim: int, max_entries: int = 10000, path: str | None = None, hnsw_min_entries: int = 50000, ttl: float | None = None):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._bank = np.zeros((max_entries, dim), dtype=np.float32)
+        self._used = 0  # rows [0, _used) have been written at least once
+        self._entries = OrderedDict()  # row -> (store key, scope, created, value), least recently used first
+        self._lock = threading.Lock()
+        self._store = diskcache.Cache(path) if path else None
+        self._index = None
+        if max_entries >= hnsw_min_entries:
+            self._index = self._new_index()
+            self._row_label = np.full(max_entries, -1, dtype=np.int64)  # current graph label of each row
+            self._label_row = []  # graph label -> row it was added for
+            self._rebuilding = False
+            self._rebuild_pending = []  # rows written while a background rebuild runs
+        # Compile (or load the cached build of) the kernel before the first request.
+        # Compiling without running it keeps Numba's thread pool from starting
+        # before a `gunicorn --preload` fork.
+        cosine_topk.compile("(float32[::1], float32[:, ::1], int64)")
+        if self._store is not None:
+            self._load()
+        if self._index is not None:
+            # Past the bulk load, lookups and inserts are one vector at a time, so
+            # OpenMP buys nothing; single-threaded also keeps the index usable in
+            # forked workers
+            faiss.omp_set_num_threads(1)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, vector: np.ndarray, threshold: float = 0.97, scope=None):
+        with self._lock:
+            if not self._entries:
+                return None
+            query = self._as_query(vector)
+            if self._index is not None:
+                candidates = self._search_hnsw(query)
+            else:
+                rows, scores = cosine_topk(query, self._bank[:self._used], 1)
+                candidates = zip(rows, scores)
+                # Only when the nearest entry is close enough but unusable are further ones worth scanning
+                if scores[0] >= threshold and not self._usable(int(rows[0]), scope):
+                    rows, scores = cosine_topk(query, self._bank[:self._used], self.HNSW_CANDIDATES)
+                    candidates = zip(rows, scores)
+            for row, score in candidates:
+                if score < threshold:
+                    break
+                if self._usable(int(row), scope):
+                    self._entries.move_to_end(int(row))
+                    return self._entries[int(row)][3]
+            return None
+
+    def insert(self, vector: np.ndarray, value, scope=None):
+        with self._lock:
+            query = self._as_query(vector)
+            # Random store keys keep workers sharing one cache directory from clobbering each other
+            key = uuid.uuid4().hex
+            created = time.time()
+            self._add(key, query, scope, created, value)
+            if self._store is not None:
+                self._store.set(key, (created, query, scope, value), expire=self.ttl)
+
+    def _usable(self, row: int, scope) -> bool:
+        entry = self._entries.get(row)
+        if entry is None or entry[1] != scope:
+            return False
+        return self.ttl is None or time.time() - entry[2] < self.ttl
+
+    def _add(self, key: str, query: np.ndarray, scope, created: float, value, index: bool = True):
+        if len(self._entries) >= self.max_entries:
+            row = self._evict()
+        else:
+            row = self._used
+            self._used += 1
+        self._bank[row] = query
+        self._entries[row] = (key, scope, created, value)
+        if index and self._index is not None:
+            self._add_to_index(row)
+
+    def _evict(self) -> int:
+        row, (key, *_) = self._entries.popitem(last=False)
+        if self._store is not None:
+            self._store.delete(key)
+        return row
+
+    def _new_index(self):
+        index = faiss.IndexHNSWFlat(self.dim, self.HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = self.HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = self.HNSW_EF_SEARCH
+        return index
+
+    def _add_to_index(self, row: int):
+        if self._index.ntotal >= 2 * self.max_entries and not self._rebuilding:
+            self._start_rebuild()
+        if self._rebuilding:
+            self._rebuild_pending.append(row)
+        self._row_label[row] = len(self._label_row)
+        self._label_row.append(row)
+        self._index.add(self._bank[row:row + 1])
+
+    def _live_rows(self) -> np.ndarray:
+        return np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+
+    def _rebuild_index(self):
+        rows = self._live_rows()
+        index = self._new_index()
+        if len(rows):
+            index.add(self._bank[rows])
+        self._install_index(index, rows.tolist())
+
+    def _start_rebuild(self):
+        # Called under the lock; the graph is built from a copy so inserts can keep writing the bank
+        rows = self._live_rows()
+        self._rebuilding = True
+        self._rebuild_pending = []
+        # Not a daemon: interpreter shutdown waits for it instead of aborting inside Faiss
+        threading.Thread(target=self._build_in_background, args=(rows, self._bank[rows])).start()
+
+    def _build_in_background(self, rows: np.ndarray, vectors: np.ndarray):
+        index = self._new_index()
+        label_row = rows.tolist()
+        while True:
+            if len(vectors):
+                index.add(vectors)  # Faiss releases the GIL, so requests keep being served
+            with self._lock:
+                # Rows (re)written since the last snapshot go in on top, superseding their older label;
+                # they are caught up outside the lock until only a few are left to add before the swap
+                pending = list(dict.fromkeys(self._rebuild_pending))
+                self._rebuild_pending = []
+                label_row.extend(pending)
+                vectors = self._bank[pending]
+                if len(pending) <= self.HNSW_SWAP_PENDING:
+                    if pending:
+                        index.add(vectors)
+                    self._rebuilding = False
+                    self._install_index(index, label_row)
+                    return
+
+    def _install_index(self, index, label_row: list[int]):
+        self._index = index
+        self._label_row = label_row
+        self._row_label[:] = -1
+        if label_row:
+            # A row added more than once keeps its last label
+            reversed_rows = np.array(label_row[::-1], dtype=np.int64)
+            rows, first = np.unique(reversed_rows, return_index=True)
+            self._row_label[rows] = len(label_row) - 1 - first
+
+    def _search_hnsw(self, query: np.ndarray):
+        """Live (row, score) candidates, best first; stale labels are skipped."""
+        scores, labels = self._index.search(query[None, :], self.HNSW_CANDIDATES)
+        candidates = []
+        for label, score in zip(labels[0], scores[0]):
+            if label < 0:
+                break
+            row = self._label_row[label]
+            if self._row_label[row] == label:
+                candidates.append((row, score))
+        return candidates
+
+    def _load(self):
+        records = []
+        for key in self._store.iterkeys():
+            try:
+                record = self._store.get(key)
+            except Exception:
+                # e.g. a pickled class that no longer imports; a cache entry is not worth a failed start
+                record = None
+                self._store.delete(key)
+            # Records from before scopes were stored cannot be matched to a request, drop them
+            if record is not None and len(record) != 4:
+                self._store.delete(key)
+            elif record is not None:
+                records.append((key, *record))
+        for key, created, vector, scope, value in sorted(records, key=lambda r: r[1]):
+            self._add(key, self._as_query(vector), scope, created, value, index=False)
+        if self._index is not None and self._entries:
+            # One batched add builds the graph in parallel
+            self._rebuild_index()
+
+    def _as_query(self, vector: np.ndarray) -> np.ndarray:
+        query = np.array(vector, dtype=np.float32).reshape(self.dim)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query /= norm
+        return query
@@ -1,9 +1,14 @@
 import os
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 import time
+import random
+import httpx
+import numpy as np
+import torch
 from dotenv import load_dotenv
 from sentence_transformers import SentenceTransformer
 from qdrant_client import QdrantClient
+from qdrant_client.http.models import SearchParams, QuantizationSearchParams, PayloadSelectorInclude
 from anthropic import Anthropic
 from anthropic._exceptions import OverloadedError
 
@@ -13,57 +18,80 @@ load_dotenv()
 # Konfiguration
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
 COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "confluence_knowledge")
 CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY")
 CLAUDE_MODEL = os.getenv("CLAUDE_MODEL", "claude-3-5-sonnet-20240620")  # Updated default model
+EMBED_NUM_THREADS = int(os.getenv("EMBED_NUM_THREADS") or os.cpu_count() or 1)
+
+# System-Prompt und Prompt-Vorlage werden einmal beim Import gebaut.
+# Der System-Prompt ist als cachebarer Block markiert (Anthropic Prompt Caching).
+SYSTEM_PROMPT = "Du bist ein hilfreicher Assistent, der Fragen auf Basis interner Wissensdokumente beantwortet. Wenn die Antwort nicht im Kontext enthalten ist, sage ehrlich 'Ich weiß es nicht.'"
+SYSTEM_BLOCKS = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+USER_TEMPLATE = (
+    "Bitte beantworte die folgende Frage nur auf Basis des bereitgestellten Kontexts.\n\n"
+    "--- BEGINN KONTEXT ---\n{context}--- ENDE KONTEXT ---\n\n"
+    "Frage: {question}"
+)
 
 # Initialisierung
-client = QdrantClient(url=f"http://{QDRANT_HOST}:{QDRANT_PORT}")
-embedder = SentenceTransformer("paraphrase-MiniLM-L6-v2")
-anthropic = Anthropic(api_key=CLAUDE_API_KEY)
+# Alle Kerne für den PyTorch-Encoder nutzen (manche Container-Images starten mit nur einem Thread)
+torch.set_num_threads(EMBED_NUM_THREADS)
+torch.set_num_interop_threads(2)
+client = QdrantClient(
+    host=QDRANT_HOST,
+    port=QDRANT_PORT,
+    grpc_port=QDRANT_GRPC_PORT,
+    prefer_grpc=True,
+    https=False,
+    timeout=60,
+)
+embedder = SentenceTransformer("paraphrase-MiniLM-L6-v2", device="cuda" if torch.cuda.is_available() else "cpu")
+# Keep-alive HTTP/2 connection reused across retries; SDK retries off so only our backoff loop retries
+anthropic = Anthropic(api_key=CLAUDE_API_KEY, http_client=httpx.Client(http2=True), max_retries=0)
 
 def get_context(query: str, top_k=3):
     """
     Findet die relevantesten Text-Chunks für eine gegebene Anfrage
     mithilfe von Vektor-Ähnlichkeitssuche in Qdrant.
     """
-    query_embedding = embedder.encode(query).tolist()
+    # Normalisierter float32-Vektor wird direkt an Qdrant übergeben (kein .tolist())
+    query_embedding = embedder.encode(query, convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
 
     # Use query_points instead of the deprecated search method
     search_result = client.query_points(
         collection_name=COLLECTION_NAME,
         query=query_embedding,
+        search_params=SearchParams(hnsw_ef=64, quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)),
         limit=top_k,
-        with_payload=True
+        with_payload=PayloadSelectorInclude(include=["source", "page", "text"])
     )
     # The result object is now in search_result.points
     return search_result.points
 
+def format_chunk(i: int, chunk) -> str:
+    payload = chunk.payload
+    source = payload.get('source', 'Unbekannte Quelle')
+    page = payload.get('page', '?')
+    text = payload.get('text', '')
+    return f"Dokument {i+1} (Quelle: {source}, Seite: {page}):\n{text}\n\n"
+
 def build_prompt(query: str, context_chunks):
-    context_text = ""
-    for i, chunk in enumerate(context_chunks):
-        context_text += f"Dokument {i+1} (Quelle: {chunk.payload.get('source', 'Unbekannte Quelle')}, Seite: {chunk.payload.get('page', '?')}):\n{chunk.payload.get('text', '')}\n\n"
-    
+    # Ein einziger join statt wiederholtem += (jede Iteration würde den String neu kopieren)
+    context_text = "".join(format_chunk(i, chunk) for i, chunk in enumerate(context_chunks))
+
     # The prompt for the Messages API is just the user's request.
-    # The system prompt will be handled separately.
-    user_prompt = (
-        f"Bitte beantworte die folgende Frage nur auf Basis des bereitgestellten Kontexts.\n\n"
-        f"--- BEGINN KONTEXT ---\n{context_text}--- ENDE KONTEXT ---\n\n"
-        f"Frage: {query}"
-    )
-    return user_prompt
+    # The system prompt is sent separately as SYSTEM_BLOCKS.
+    return USER_TEMPLATE.format(context=context_text, question=query)
 
 def ask_claude(prompt: str, max_retries=3):
-    # System prompt defines the AI's role and rules.
-    system_prompt = "Du bist ein hilfreicher Assistent, der Fragen auf Basis interner Wissensdokumente beantwortet. Wenn die Antwort nicht im Kontext enthalten ist, sage ehrlich 'Ich weiß es nicht.'"
-    
     for attempt in range(max_retries):
         try:
             # Use the Messages API for Claude 3 models
             response = anthropic.messages.create(
                 model=CLAUDE_MODEL,
                 max_tokens=500,
-                system=system_prompt,
+                system=SYSTEM_BLOCKS,
                 messages=[
                     {"role": "user", "content": prompt}
                 ]
@@ -72,9 +100,9 @@ def ask_claude(prompt: str, max_retries=3):
             return response.content[0].text.strip()
         except OverloadedError as e:
             if attempt < max_retries - 1:
-                # Use exponential backoff for retries (e.g., 1s, 2s, 4s)
-                wait_time = 2 ** attempt
-                print(f"Server is overloaded. Retrying in {wait_time} seconds... (Attempt {attempt + 1}/{max_retries})")
+                # Exponential backoff with full jitter (random wait up to 1s, 2s, 4s, ...)
+                wait_time = random.uniform(0, 2 ** attempt)
+                print(f"Server is overloaded. Retrying in {wait_time:.1f} seconds... (Attempt {attempt + 1}/{max_retries})")
                 time.sleep(wait_time)
             else:
                 print("Server is still overloaded after multiple retries. Please try again later.")
@@ -1,6 +1,6 @@
 import os
-import requests
-from requests.auth import HTTPBasicAuth
+import asyncio
+import httpx
 from dotenv import load_dotenv
 
 # .env laden
@@ -12,26 +12,65 @@ SPACE_KEY = os.getenv("CONFLUENCE_SPACE")
 EMAIL = os.getenv("CONFLUENCE_EMAIL")
 API_TOKEN = os.getenv("CONFLUENCE_API_TOKEN")
 
-auth = HTTPBasicAuth(EMAIL, API_TOKEN)
 headers = {
     "Accept": "application/json"
 }
 
-def get_pages(limit=5):
-    url = f"{BASE_URL}/rest/api/content"
+async def fetch_window(client, start, limit):
+    """Lädt ein Fenster von `limit` Seiten ab Position `start`."""
     params = {
         "limit": limit,
+        "start": start,
         "spaceKey": SPACE_KEY,
         "expand": "body.storage"
     }
 
-    response = requests.get(url, headers=headers, auth=auth, params=params)
+    response = await client.get(f"{BASE_URL}/rest/api/content", params=params)
 
     if response.status_code != 200:
         raise Exception(f"Fehler bei Anfrage: {response.status_code} - {response.text}")
 
-    data = response.json()
-    return data.get("results", [])
+    return response.json()
+
+async def fetch_pages(limit=25, concurrency=8):
+    """
+    Lädt alle Seiten des Space. Nach dem ersten Fenster werden jeweils
+    `concurrency` Fenster parallel über denselben HTTP/2-Pool abgefragt.
+    """
+    async with httpx.AsyncClient(
+        http2=True,
+        auth=(EMAIL, API_TOKEN),
+        headers=headers,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=50),
+        timeout=30,
+    ) as client:
+        first = await fetch_window(client, 0, limit)
+        pages = first.get("results", [])
+        # Confluence kann das Limit (z. B. bei expand=body.storage) serverseitig kürzen
+        limit = first.get("limit", limit)
+        if "next" not in first.get("_links", {}):
+            return pages
+
+        # Fenster sind Positionen in der ungefilterten Liste, auch ein kurzes deckt `limit` ab
+        start = first.get("start", 0) + limit
+        while True:
+            windows = await asyncio.gather(*[
+                fetch_window(client, offset, limit)
+                for offset in range(start, start + concurrency * limit, limit)
+            ])
+            # Kurze Fenster (z. B. durch Berechtigungen gefiltert) sind kein Ende;
+            # Schluss ist erst bei einem leeren Fenster oder ohne "next" im letzten
+            for window in windows:
+                results = window.get("results", [])
+                if not results:
+                    return pages
+                pages.extend(results)
+            if "next" not in windows[-1].get("_links", {}):
+                return pages
+            start += concurrency * limit
+
+def get_pages(limit=25):
+    return asyncio.run(fetch_pages(limit))
 
 # Beispielnutzung
 if __name__ == "__main__":
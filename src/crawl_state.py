@@ -0,0 +1,48 @@
+import sqlite3
+
+
+class CrawlState:
+    """Per-page sync state of the last crawl, stored in SQLite.
+
+    Remembers which Confluence version of a page (and which embedding
+    setup) is currently indexed, so unchanged pages can be skipped.
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                page_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                last_modified TEXT,
+                embedding_version TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def is_current(self, page_id: str, version: int, embedding_version: str) -> bool:
+        row = self.conn.execute(
+            "SELECT version, embedding_version FROM pages WHERE page_id = ?",
+            (page_id,),
+        ).fetchone()
+        return row is not None and row[0] == version and row[1] == embedding_version
+
+    def page_ids(self) -> set[str]:
+        return {row[0] for row in self.conn.execute("SELECT page_id FROM pages")}
+
+    def mark_indexed(self, page_id: str, version: int, last_modified: str | None, embedding_version: str):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages (page_id, version, last_modified, embedding_version) VALUES (?, ?, ?, ?)",
+            (page_id, version, last_modified, embedding_version),
+        )
+        self.conn.commit()
+
+    def forget(self, page_id: str):
+        self.conn.execute("DELETE FROM pages WHERE page_id = ?", (page_id,))
+        self.conn.commit()
+
+    def clear(self):
+        self.conn.execute("DELETE FROM pages")
+        self.conn.commit()
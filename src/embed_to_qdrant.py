@@ -1,12 +1,44 @@
 import os
+import re
+import sys
+from html import escape
+import numpy as np
+import torch
+import torch.nn.functional as F
+import queue
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
+from tqdm import tqdm
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:  # selectolax has no wheel for some platforms; lxml is the C-parser fallback
+    HTMLParser = None
+    import lxml.html
 from requests.auth import HTTPBasicAuth
 from sentence_transformers import SentenceTransformer
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import VectorParams, Distance, PointStruct
+from qdrant_client.http.models import (
+    VectorParams,
+    Distance,
+    HnswConfigDiff,
+    OptimizersConfigDiff,
+    CollectionParamsDiff,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    Datatype,
+    PayloadSchemaType,
+    Filter,
+    FieldCondition,
+    MatchAny,
+    FilterSelector,
+)
 import uuid
+from crawl_state import CrawlState
+from embedding_cache import EmbeddingCache, text_hash
 
 # Load environment variables from .env file
 print("Loading environment variables...")
@@ -17,6 +49,33 @@ SPACE_KEY = os.getenv("CONFLUENCE_SPACE")
 EMAIL = os.getenv("CONFLUENCE_EMAIL")
 API_TOKEN = os.getenv("CONFLUENCE_API_TOKEN")
 COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "confluence_knowledge")
+CRAWL_STATE_PATH = os.getenv("CRAWL_STATE_PATH", "crawl_state.sqlite")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+# Points per upload request and number of upload workers. Above 1, upload_collection
+# starts a fresh process pool (and gRPC channels) for every pipeline batch.
+UPLOAD_BATCH_SIZE = int(os.getenv("QDRANT_UPLOAD_BATCH", 64))
+UPLOAD_PARALLEL = int(os.getenv("QDRANT_UPLOAD_PARALLEL") or 1)
+
+MODEL_NAME = "paraphrase-MiniLM-L6-v2"
+# INT8 ONNX export shipped in the model repo (AVX-512 VNNI kernels on CPUs that have them)
+MODEL_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+# Identifies the encoder in the embedding cache
+MODEL_KEY = f"{MODEL_NAME}/{MODEL_FILE}"
+CHUNK_WORDS = 100
+ENCODE_BATCH_SIZE = 64
+# Progress bars only on a terminal, so CI logs do not get a line per refresh
+SHOW_PROGRESS = sys.stderr.isatty()
+# Chunks handed from the fetch/chunk thread to the encoder per batch, and batches buffered between them
+PIPELINE_BATCH = 256
+PIPELINE_DEPTH = 4
+# HNSW settings of the finished collection; during the initial bulk upload the graph is switched off
+HNSW_M = 16
+HNSW_EF_CONSTRUCT = 128
+INDEXING_THRESHOLD = 20000
+# Bumped when html_to_text output changes (2: CDATA of code/noformat macros is kept again)
+TEXT_VERSION = 2
+# Changing the model, the text extraction or the chunking invalidates every indexed page
+EMBEDDING_VERSION = f"{MODEL_KEY}/{CHUNK_WORDS}/text{TEXT_VERSION}"
 
 print(f"Confluence URL: {BASE_URL}")
 print(f"Confluence Space: {SPACE_KEY}")
@@ -24,11 +83,26 @@ print(f"Qdrant Collection: {COLLECTION_NAME}")
 
 
 auth = HTTPBasicAuth(EMAIL, API_TOKEN)
-headers = { "Accept": "application/json" }
+# Compressed, keep-alive responses: storage-format HTML shrinks several-fold with gzip
+headers = {
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip, deflate",
+    "Connection": "keep-alive",
+}
+
+# Keep-alive session shared by all Confluence requests; the pool covers the parallel body fetches
+FETCH_WORKERS = 8
+session = requests.Session()
+session.auth = auth
+session.headers.update(headers)
+adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
 
 # Qdrant configuration
 qdrant_host = os.getenv("QDRANT_HOST")
 qdrant_port = int(os.getenv("QDRANT_PORT", 6333))
+qdrant_grpc_port = int(os.getenv("QDRANT_GRPC_PORT", 6334))
 qdrant_api_key = os.getenv("QDRANT_API_KEY")
 qdrant_use_ssl = os.getenv("QDRANT_USE_SSL", "false").lower() == "true"
 
@@ -43,6 +117,9 @@ if qdrant_api_key:
     qdrant_client = QdrantClient(
         host=qdrant_host,
         port=qdrant_port,
+        grpc_port=qdrant_grpc_port,
+        prefer_grpc=True,
+        timeout=60,
         api_key=qdrant_api_key,
         https=qdrant_use_ssl,
     )
@@ -53,90 +130,265 @@ else:
     qdrant_client = QdrantClient(
         host=qdrant_host, 
         port=qdrant_port,
+        grpc_port=qdrant_grpc_port,
+        prefer_grpc=True,
+        timeout=60,
         https=qdrant_use_ssl
     )
 
-# Get pages
-def get_pages(limit=10):
+# Encoder, loaded once on first use
+_MODEL = None
+
+def get_model():
+    global _MODEL
+    if _MODEL is None:
+        _MODEL = SentenceTransformer(MODEL_NAME, backend="onnx", model_kwargs={"file_name": MODEL_FILE})
+    return _MODEL
+
+# Get all pages of the space, one window at a time (version info only; bodies are fetched for changed pages)
+def get_pages(limit=100):
     url = f"{BASE_URL}/rest/api/content"
-    params = {
-        "limit": limit,
-        "spaceKey": SPACE_KEY,
-        "expand": "body.storage"
-    }
-    response = requests.get(url, headers=headers, auth=auth, params=params)
+    start = 0
+    while True:
+        params = {
+            "limit": limit,
+            "start": start,
+            "spaceKey": SPACE_KEY,
+            "expand": "version"
+        }
+        response = session.get(url, params=params)
+        if response.status_code != 200:
+            raise Exception(f"Error during request: {response.status_code} - {response.text}")
+        data = response.json()
+        results = data.get("results", [])
+        yield from results
+        if not results or "next" not in data.get("_links", {}):
+            return
+        # Windows are offsets into the unfiltered list: a window cut short (e.g. by
+        # permissions) still covers `limit` positions, so advance by what the server used
+        start = data.get("start", start) + data.get("limit", limit)
+
+# Get the storage-format body of a single page
+def get_page_html(page_id):
+    url = f"{BASE_URL}/rest/api/content/{page_id}"
+    params = {"expand": "body.storage"}
+    response = session.get(url, params=params)
     if response.status_code != 200:
         raise Exception(f"Error during request: {response.status_code} - {response.text}")
-    return response.json().get("results", [])
+    return response.json()["body"]["storage"]["value"]
+
+# Storage format keeps code and noformat macro bodies in CDATA, which the HTML parsers drop
+CDATA = re.compile(r"<!\[CDATA\[(.*?)\]\]>", re.DOTALL)
 
 # HTML to text
 def html_to_text(html):
-    soup = BeautifulSoup(html, "html.parser")
-    return soup.get_text(separator="\n")
+    if not html.strip():
+        return ""
+    # Turn CDATA into escaped text so the parsers keep it as a text node
+    html = CDATA.sub(lambda m: escape(m.group(1), quote=False), html)
+    if HTMLParser is not None:
+        body = HTMLParser(html).body
+        return body.text(separator="\n") if body is not None else ""
+    return "\n".join(lxml.html.fromstring(html).itertext())
 
 # Chunk text
-def chunk_text(text, max_words=100):
+def chunk_text(text, max_words=CHUNK_WORDS):
     words = text.split()
-    return [" ".join(words[i:i+max_words]) for i in range(0, len(words), max_words) if len(words[i:i+max_words]) > 5]
+    n = len(words)
+    # Skip chunks of 5 words or fewer without slicing twice
+    return [" ".join(words[i:i+max_words]) for i in range(0, n, max_words) if min(max_words, n - i) > 5]
 
-# Initialize or replace collection
+# Initialize collection; returns True if it was (re)created empty
 def init_collection(dim):
     if qdrant_client.collection_exists(COLLECTION_NAME):
+        params = qdrant_client.get_collection(COLLECTION_NAME).config.params
+        vectors = params.vectors
+        if vectors.size == dim and vectors.distance == Distance.DOT and vectors.datatype == Datatype.FLOAT16:
+            if not params.on_disk_payload:
+                # Payload storage can be moved without rebuilding the vectors
+                qdrant_client.update_collection(
+                    collection_name=COLLECTION_NAME,
+                    collection_params=CollectionParamsDiff(on_disk_payload=True),
+                )
+            return False
         qdrant_client.delete_collection(COLLECTION_NAME)
 
+    # Every encoder path L2-normalizes, so DOT ranks like cosine without Qdrant re-normalizing each vector.
+    # Originals stored as float16 on disk, INT8 scalar quantization kept in RAM for the
+    # search; queries rescore the candidates with the originals.
+    # No HNSW graph and no indexing while the collection is filled, see enable_indexing()
     qdrant_client.create_collection(
         collection_name=COLLECTION_NAME,
-        vectors_config={
-            "size": dim,
-            "distance": "Cosine"
-        }
+        vectors_config=VectorParams(size=dim, distance=Distance.DOT, on_disk=True, datatype=Datatype.FLOAT16),
+        hnsw_config=HnswConfigDiff(m=0, ef_construct=HNSW_EF_CONSTRUCT),
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=0),
+        # Chunk texts dominate the payload and are only read for the few hits, so they stay on disk
+        on_disk_payload=True,
+        quantization_config=ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8,
+                quantile=0.99,
+                always_ram=True,
+            )
+        ),
+    )
+    # Keyword index so a page's chunks can be replaced by filter
+    qdrant_client.create_payload_index(
+        collection_name=COLLECTION_NAME,
+        field_name="page_id",
+        field_schema=PayloadSchemaType.KEYWORD,
+    )
+    return True
+
+# Build the HNSW graph in one pass once the bulk upload is done.
+# Also runs on later syncs, so a collection left unindexed by an aborted first run gets its graph.
+def enable_indexing():
+    if qdrant_client.get_collection(COLLECTION_NAME).config.hnsw_config.m != 0:
+        return
+    qdrant_client.update_collection(
+        collection_name=COLLECTION_NAME,
+        hnsw_config=HnswConfigDiff(m=HNSW_M, ef_construct=HNSW_EF_CONSTRUCT),
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=INDEXING_THRESHOLD),
+    )
+    print("🧱 HNSW-Index wird aufgebaut")
+
+# Remove all chunks belonging to the given pages
+def delete_page_points(page_ids):
+    qdrant_client.delete(
+        collection_name=COLLECTION_NAME,
+        points_selector=FilterSelector(
+            filter=Filter(must=[FieldCondition(key="page_id", match=MatchAny(any=list(page_ids)))])
+        ),
     )
 
 # Embedding and upload
-def embed_and_upload(chunks, metadaten):
-    model = SentenceTransformer("paraphrase-MiniLM-L6-v2")
-    vectors = model.encode(chunks)
-    init_collection(vectors.shape[1])
-
-    points = []
-    for i, (vec, meta) in enumerate(zip(vectors, metadaten)):
-        point = PointStruct(
-            id=str(uuid.uuid4()),
-            vector=vec.tolist(),
-            payload=meta
-        )
-        points.append(point)
-
-    qdrant_client.upload_points(
+# Tokenize all texts in one call to the Rust tokenizer, then run length-sorted,
+# per-batch padded mini-batches through the model's own forward pass (transformer + pooling)
+def encode_pretokenized(model, texts):
+    features = model.tokenizer(texts, truncation=True, max_length=model.max_seq_length)
+    order = np.argsort([-len(ids) for ids in features["input_ids"]], kind="stable")
+    embeddings = np.empty((len(texts), model.get_sentence_embedding_dimension()), dtype=np.float32)
+    for start in tqdm(range(0, len(texts), ENCODE_BATCH_SIZE), desc="Encoding", unit="batch", leave=False, disable=not SHOW_PROGRESS):
+        idx = order[start:start + ENCODE_BATCH_SIZE]
+        batch = model.tokenizer.pad({key: [features[key][i] for i in idx] for key in features.keys()}, return_tensors="pt")
+        batch = {key: value.to(model.device) for key, value in batch.items()}
+        with torch.inference_mode():
+            vectors = model(batch)["sentence_embedding"]
+        embeddings[idx] = F.normalize(vectors.float(), dim=1).cpu().numpy()
+    return embeddings
+
+def embed_chunks(chunks, cache):
+    # Only chunk texts not embedded before go through the model
+    hashes = [text_hash(chunk) for chunk in chunks]
+    cached = cache.get_many(hashes, MODEL_KEY)
+    missing = [i for i, key in enumerate(hashes) if key not in cached]
+    tqdm.write(f"🗃️ {len(chunks) - len(missing)} Embeddings aus dem Cache, {len(missing)} neu")
+
+    vectors = np.empty((len(chunks), cache.dim), dtype=np.float32)
+    for i, key in enumerate(hashes):
+        if key in cached:
+            vectors[i] = cached[key]
+    if missing:
+        encoded = encode_pretokenized(get_model(), [chunks[i] for i in missing])
+        vectors[missing] = encoded
+        cache.put_many([hashes[i] for i in missing], MODEL_KEY, encoded)
+    return vectors
+
+def embed_and_upload(chunks, metadaten, cache):
+    vectors = embed_chunks(chunks, cache)
+
+    # Vectors go up as one float32 array; ids are generated in one pass instead of per PointStruct.
+    # With the default parallel=1 this runs in-process on one channel, no worker pool per batch.
+    # Random UUIDs rather than range(n): earlier runs' chunks of unchanged pages stay in the collection.
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ids = [str(uuid.uuid4()) for _ in range(len(chunks))]
+    qdrant_client.upload_collection(
         collection_name=COLLECTION_NAME,
-        points=points,
+        vectors=vectors,
+        payload=metadaten,
+        ids=ids,
+        batch_size=UPLOAD_BATCH_SIZE,
+        parallel=UPLOAD_PARALLEL,
     )
-    print(f"✅ {len(points)} Chunks gespeichert in Qdrant (Collection: {COLLECTION_NAME})")
+    tqdm.write(f"✅ {len(ids)} Chunks gespeichert in Qdrant (Collection: {COLLECTION_NAME})")
+
+# Producer: fetch, convert and chunk the pages, handing batches of PIPELINE_BATCH chunks to `batches`.
+# Ends with None, or with the exception that stopped it.
+def produce_batches(pages, batches):
+    try:
+        chunks, meta = [], []
+        progress = tqdm(total=len(pages), desc="Seiten", unit="page", disable=not SHOW_PROGRESS)
+        with progress, ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            # Bodies are fetched in parallel over the pooled session, a few windows ahead of the chunker
+            window = FETCH_WORKERS * 4
+            for start in range(0, len(pages), window):
+                part = pages[start:start + window]
+                for page, html in zip(part, executor.map(get_page_html, [page["id"] for page in part])):
+                    title = page["title"]
+                    url = f"{BASE_URL}/pages/viewpage.action?pageId={page['id']}"
+                    page_chunks = chunk_text(html_to_text(html))
+
+                    for chunk in page_chunks:
+                        chunks.append(chunk)
+                        meta.append({
+                            "page_id": page["id"],
+                            "title": title,
+                            "url": url,
+                            "text": chunk,
+                            # Short preview so result lists can skip fetching the full chunk
+                            "preview": chunk[:200]
+                        })
+                        if len(chunks) >= PIPELINE_BATCH:
+                            batches.put((chunks, meta))
+                            chunks, meta = [], []
+
+                    progress.update()
+        if chunks:
+            batches.put((chunks, meta))
+        batches.put(None)
+    except BaseException as e:
+        batches.put(e)
 
 # Main process
 if __name__ == "__main__":
+    state = CrawlState(CRAWL_STATE_PATH)
+    dim = get_model().get_sentence_embedding_dimension()
+    embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, dim)
+    if init_collection(dim):
+        print("🆕 Collection neu angelegt, alle Seiten werden indexiert")
+        state.clear()
+
     print("🔍 Lade Confluence Seiten ...")
-    pages = get_pages()
-
-    all_chunks = []
-    all_meta = []
-
-    for page in pages:
-        title = page["title"]
-        html = page["body"]["storage"]["value"]
-        url = f"{BASE_URL}/pages/viewpage.action?pageId={page['id']}"
-        text = html_to_text(html)
-        chunks = chunk_text(text)
-
-        for chunk in chunks:
-            all_chunks.append(chunk)
-            all_meta.append({
-                "title": title,
-                "url": url,
-                "text": chunk
-            })
-
-        print(f"📄 {title}: {len(chunks)} Chunks")
-
-    print(f"📦 Gesamt: {len(all_chunks)} Chunks")
-    embed_and_upload(all_chunks, all_meta)
\ No newline at end of file
+    # Only pages whose Confluence version (or our embedding setup) changed are re-indexed
+    seen = set()
+    changed = []
+    for page in get_pages():
+        if page["id"] in seen:
+            continue
+        seen.add(page["id"])
+        if not state.is_current(page["id"], page["version"]["number"], EMBEDDING_VERSION):
+            changed.append(page)
+    removed = state.page_ids() - seen
+    print(f"♻️ {len(seen) - len(changed)} unverändert, {len(changed)} geändert, {len(removed)} entfernt")
+
+    stale = removed | {page["id"] for page in changed}
+    if stale:
+        delete_page_points(stale)
+
+    # Fetching and chunking run in a background thread while this one encodes and uploads;
+    # the bounded queue keeps memory independent of the space size
+    batches = queue.Queue(maxsize=PIPELINE_DEPTH)
+    threading.Thread(target=produce_batches, args=(changed, batches), daemon=True).start()
+    total = 0
+    while (batch := batches.get()) is not None:
+        if isinstance(batch, BaseException):
+            raise batch
+        embed_and_upload(*batch, embedding_cache)
+        total += len(batch[0])
+    print(f"📦 Gesamt: {total} Chunks")
+    enable_indexing()
+
+    for page in changed:
+        state.mark_indexed(page["id"], page["version"]["number"], page["version"].get("when"), EMBEDDING_VERSION)
+    for page_id in removed:
+        state.forget(page_id)
@@ -0,0 +1,54 @@
+import hashlib
+import sqlite3
+
+import numpy as np
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Chunk embeddings keyed by (sha256 of the chunk text, model), stored in SQLite.
+
+    Lets a re-index embed only chunks whose text has not been seen before.
+    Vectors are stored as float16 to halve the file size.
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.dim = dim
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                text_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (text_hash, model)
+            )
+            """
+        )
+        self.conn.commit()
+
+    def get_many(self, hashes: list[str], model: str) -> dict[str, np.ndarray]:
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(unique), 500):
+            part = unique[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(part))})",
+                (model, *part),
+            )
+            for key, blob in rows:
+                vector = np.frombuffer(blob, dtype=np.float16)
+                if vector.shape[0] == self.dim:
+                    found[key] = vector.astype(np.float32)
+        return found
+
+    def put_many(self, hashes: list[str], model: str, vectors: np.ndarray):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (text_hash, model, vector) VALUES (?, ?, ?)",
+            [(key, model, vector.astype(np.float16).tobytes()) for key, vector in zip(hashes, vectors)],
+        )
+        self.conn.commit()
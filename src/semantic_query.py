@@ -1,8 +1,17 @@
 import os
+import functools
 from dotenv import load_dotenv
 from sentence_transformers import SentenceTransformer
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Filter, FieldCondition, MatchValue
+from qdrant_client.http.models import (
+    Filter,
+    FieldCondition,
+    MatchValue,
+    PayloadSelectorInclude,
+    QueryRequest,
+    SearchParams,
+    QuantizationSearchParams,
+)
 import numpy as np
 
 # .env laden
@@ -10,32 +19,79 @@ load_dotenv()
 
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
 COLLECTION_NAME = os.getenv("QDRANT_COLLECTION", "confluence_knowledge")
 
-# Initialisiere Qdrant und Embedding-Modell
-client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
-model = SentenceTransformer("paraphrase-MiniLM-L6-v2")
+# Initialisiere Qdrant
+# gRPC: Vektoren gehen als Protobuf statt als JSON-Text über die Leitung
+client = QdrantClient(
+    host=QDRANT_HOST,
+    port=QDRANT_PORT,
+    grpc_port=QDRANT_GRPC_PORT,
+    prefer_grpc=True,
+    timeout=60,
+)
 
-def semantic_search(query: str, top_k: int = 3):
-    print(f"🔎 Frage: {query}")
-    query_vector = model.encode(query).tolist()
-
-    search_result = client.search(
-        collection_name=COLLECTION_NAME,
-        query_vector=query_vector,
-        limit=top_k,
-        with_payload=True
+@functools.lru_cache(maxsize=None)
+def get_model():
+    """Lädt das Embedding-Modell beim ersten Aufruf; der Import bleibt dadurch billig."""
+    # INT8-quantisiertes ONNX-Modell (AVX-512 VNNI) statt PyTorch
+    return SentenceTransformer(
+        "paraphrase-MiniLM-L6-v2",
+        backend="onnx",
+        model_kwargs={"file_name": "onnx/model_qint8_avx512_vnni.onnx"},
     )
 
+# Nur Titel, URL und die beim Import gespeicherte Vorschau übertragen
+RESULT_PAYLOAD = PayloadSelectorInclude(include=["title", "url", "preview"])
+SEARCH_PARAMS = SearchParams(hnsw_ef=64, quantization=QuantizationSearchParams(rescore=True, oversampling=2.0))
+
+@functools.lru_cache(maxsize=1024)
+def _embed(query: str):
+    """Embedding einer (bereits normalisierten) Frage; wiederholte Fragen werden nicht neu kodiert."""
+    # float32-Array geht ohne .tolist() direkt in den gRPC-Request; schreibgeschützt, weil es im Cache geteilt wird
+    vector = np.ascontiguousarray(get_model().encode(query, convert_to_numpy=True, normalize_embeddings=True), dtype=np.float32)
+    vector.setflags(write=False)
+    return vector
+
+def embed_query(query: str):
+    return _embed(" ".join(query.split()).lower())
+
+def print_hits(query: str, hits, top_k: int):
+    print(f"🔎 Frage: {query}")
     print(f"🎯 Top {top_k} Treffer:")
-    for i, hit in enumerate(search_result):
+    for i, hit in enumerate(hits):
         title = hit.payload.get("title", "Ohne Titel")
         url = hit.payload.get("url", "Ohne URL")
-        text = hit.payload.get("text", "")[:200].replace("\n", " ") + "..."
+        text = hit.payload.get("preview", "").replace("\n", " ") + "..."
         print(f"\n{i+1}. 📄 {title}")
         print(f"🔗 {url}")
         print(f"🧠 {text}")
 
+def semantic_search(query: str, top_k: int = 3):
+    result = client.query_points(
+        collection_name=COLLECTION_NAME,
+        query=embed_query(query),
+        search_params=SEARCH_PARAMS,
+        limit=top_k,
+        with_payload=RESULT_PAYLOAD,
+    )
+    print_hits(query, result.points, top_k)
+    return result.points
+
+def semantic_search_many(queries: list[str], top_k: int = 3):
+    """Beantwortet mehrere Fragen mit einem einzigen Roundtrip zu Qdrant."""
+    responses = client.query_batch_points(
+        collection_name=COLLECTION_NAME,
+        requests=[
+            QueryRequest(query=embed_query(query), params=SEARCH_PARAMS, limit=top_k, with_payload=RESULT_PAYLOAD)
+            for query in queries
+        ],
+    )
+    for query, response in zip(queries, responses):
+        print_hits(query, response.points, top_k)
+    return [response.points for response in responses]
+
 if __name__ == "__main__":
     frage = input("❓ Deine Frage: ")
     semantic_search(frage)
\ No newline at end of file